@@ -0,0 +1,311 @@
+"""木材智能监测系统负载测试
+
+在本机以无界面方式启动 web.py，并通过 Streamlit 的 WebSocket 协议模拟 N 名操作员并发
+使用仪表盘（登录、刷新传感器、切换缺陷筛选、分析图片、标记警报已读），统计每次重新
+运行（rerun）的延迟分位数、吞吐量以及服务器进程的 CPU/内存占用，用于评估硬件规格和
+扩展优化的效果。只使用本机资源，不依赖外部服务。
+
+用法:
+    python load_test.py --sessions 1 5 10 20 --iterations 3
+    STATE_BACKEND_URL=sqlite:///state.db python load_test.py --sessions 10 --csv result.csv
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState, WidgetStates
+from streamlit.testing.v1.element_tree import Block, Widget, parse_tree_from_messages
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web.py")
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def get_free_port():
+    """获取本机空闲端口"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, timeout=60):
+    """以无界面方式启动 Streamlit 服务并等待就绪"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH,
+         "--server.headless", "true",
+         "--server.port", str(port),
+         "--server.address", "127.0.0.1",
+         "--browser.gatherUsageStats", "false"],
+        cwd=os.path.dirname(APP_PATH),  # web.py 按相对路径查找图片目录和瓦片缓存
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Streamlit 服务启动失败")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("等待 Streamlit 服务就绪超时")
+
+
+def stop_server(process):
+    """关闭 Streamlit 服务"""
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def read_process_stats(pid):
+    """读取进程累计 CPU 时间（秒）和常驻内存 (MB)"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK
+    rss = 0.0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) / 1024
+                break
+    return cpu, rss
+
+
+async def sample_resources(pid, stats, interval=0.2):
+    """后台采样服务器进程内存峰值"""
+    while True:
+        _, rss = read_process_stats(pid)
+        stats['peak_rss'] = max(stats['peak_rss'], rss)
+        await asyncio.sleep(interval)
+
+
+def iter_widgets(node):
+    """遍历页面树中的全部控件"""
+    if isinstance(node, Widget):
+        yield node
+    elif isinstance(node, Block):
+        for child in node.children.values():
+            yield from iter_widgets(child)
+
+
+def find_widget(widgets, label):
+    """按标签查找控件"""
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"未找到控件: {label}")
+
+
+class OperatorSession:
+    """通过 WebSocket 驱动的单个浏览器会话"""
+
+    def __init__(self, ws, latencies):
+        self.ws = ws
+        self.latencies = latencies
+        self.query_string = ""
+        self.tree = None
+        self.widget_states = {}
+
+    async def rerun(self, widget_states=None):
+        """发送一次重新运行请求，等待脚本结束并解析页面"""
+        msg = BackMsg()
+        msg.rerun_script.query_string = self.query_string
+        msg.rerun_script.page_script_hash = ""
+        if widget_states is not None:
+            msg.rerun_script.widget_states.CopyFrom(widget_states)
+
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        deltas = {}
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            msg_type = fwd.WhichOneof("type")
+            if msg_type == "delta":
+                # 同一位置可能先后收到占位元素和最终元素，只保留最新的
+                deltas[tuple(fwd.metadata.delta_path)] = fwd
+            elif msg_type == "page_info_changed":
+                self.query_string = fwd.page_info_changed.query_string
+            elif msg_type == "script_finished":
+                if fwd.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    # 脚本内部调用了 st.rerun，继续等待下一轮结果
+                    deltas = {}
+                    continue
+                if fwd.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("脚本编译失败")
+                break
+        self.latencies.append(time.perf_counter() - start)
+
+        self.tree = parse_tree_from_messages(list(deltas.values()))
+        if self.tree.exception:
+            raise RuntimeError(self.tree.exception[0].message)
+        return self.tree
+
+    def set_value(self, widget, value):
+        """按前端的方式记录控件的新值（按钮传 True 表示点击）"""
+        state = WidgetState()
+        state.id = widget.id
+        if value is True:
+            state.trigger_value = True
+        elif isinstance(value, str):
+            state.string_value = value
+        else:
+            state.string_array_value.data[:] = value
+        self.widget_states[widget.id] = state
+
+    async def interact(self):
+        """提交当前控件状态
+
+        与浏览器一致，只回传页面上仍存在的控件；未改动过的控件由服务端沿用上次的值。
+        """
+        widget_states = WidgetStates()
+        for widget in iter_widgets(self.tree):
+            if widget.id in self.widget_states:
+                widget_states.widgets.append(self.widget_states[widget.id])
+        # 按钮的触发值只在本次提交中生效
+        self.widget_states = {
+            widget_id: state for widget_id, state in self.widget_states.items()
+            if state.WhichOneof("value") != "trigger_value"
+        }
+        return await self.rerun(widget_states)
+
+
+async def operator_session(url, iterations, think_time, latencies, rng):
+    """模拟一名操作员：登录后循环执行日常操作"""
+    async with websockets.connect(url, subprotocols=["streamlit"], max_size=None) as ws:
+        session = OperatorSession(ws, latencies)
+        tree = await session.rerun()
+
+        # 登录
+        session.set_value(find_widget(tree.text_input, "用户名"), "demouser")
+        session.set_value(find_widget(tree.text_input, "密码"), "password")
+        session.set_value(find_widget(tree.button, "登录"), True)
+        tree = await session.interact()
+
+        for _ in range(iterations):
+            # 刷新传感器数据
+            session.set_value(find_widget(tree.button, "🔄 刷新数据"), True)
+            tree = await session.interact()
+            await asyncio.sleep(think_time)
+
+            # 切换缺陷筛选
+            type_filter = find_widget(tree.multiselect, "筛选缺陷类型")
+            session.set_value(type_filter, rng.sample(type_filter.options, rng.randint(1, len(type_filter.options))))
+            tree = await session.interact()
+            await asyncio.sleep(think_time)
+
+            # 选择并分析图片
+            image_select = find_widget(tree.selectbox, "选择图片")
+            session.set_value(image_select, rng.choice(image_select.options))
+            tree = await session.interact()
+            session.set_value(tree.button(key="image_analysis"), True)
+            tree = await session.interact()
+            await asyncio.sleep(think_time)
+
+            # 标记警报已读
+            unread = [button for button in tree.button if button.key and button.key.startswith("read_")]
+            if unread:
+                session.set_value(rng.choice(unread), True)
+            else:
+                session.set_value(find_widget(tree.button, "✅ 全部标记为已读"), True)
+            tree = await session.interact()
+            await asyncio.sleep(think_time)
+
+
+async def run_load(url, pid, sessions, iterations, think_time, seed):
+    """并发运行指定数量的会话并汇总指标"""
+    latencies = []
+    cpu_start, rss = read_process_stats(pid)
+    stats = {'peak_rss': rss}
+    sampler = asyncio.create_task(sample_resources(pid, stats))
+    wall_start = time.perf_counter()
+
+    results = await asyncio.gather(
+        *(operator_session(url, iterations, think_time, latencies, random.Random(seed + index))
+          for index in range(sessions)),
+        return_exceptions=True,
+    )
+
+    wall = time.perf_counter() - wall_start
+    cpu_end, _ = read_process_stats(pid)
+    sampler.cancel()
+    errors = [result for result in results if isinstance(result, Exception)]
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (np.nan,) * 3
+    return {
+        'sessions': sessions,
+        'reruns': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': len(latencies) / wall,
+        'p50_ms': p50 * 1000,
+        'p95_ms': p95 * 1000,
+        'p99_ms': p99 * 1000,
+        'cpu_percent': (cpu_end - cpu_start) / wall * 100,
+        'peak_rss_mb': stats['peak_rss'],
+        'wall_s': wall,
+    }, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟多名操作员并发会话的负载测试")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10], help="依次测试的并发会话数")
+    parser.add_argument("--iterations", type=int, default=3, help="每个会话重复操作流程的次数")
+    parser.add_argument("--think-time", type=float, default=0.0, help="操作之间的停顿时间（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--port", type=int, help="服务端口，默认自动选择空闲端口")
+    parser.add_argument("--csv", help="将结果写入CSV文件")
+    args = parser.parse_args()
+
+    if websockets is None:
+        parser.error("需要安装 websockets: pip install websockets")
+
+    port = args.port or get_free_port()
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    server = start_server(port)
+
+    header = f"{'会话数':>6} {'重运行':>6} {'错误':>4} {'吞吐(次/秒)':>10} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'CPU%':>6} {'RSS(MB)':>8}"
+    print(header)
+    print("-" * len(header))
+
+    results = []
+    try:
+        for sessions in args.sessions:
+            result, errors = asyncio.run(
+                run_load(url, server.pid, sessions, args.iterations, args.think_time, args.seed))
+            results.append(result)
+            print(f"{result['sessions']:>6} {result['reruns']:>6} {result['errors']:>4} {result['throughput_rps']:>10.2f} "
+                  f"{result['p50_ms']:>9.0f} {result['p95_ms']:>9.0f} {result['p99_ms']:>9.0f} "
+                  f"{result['cpu_percent']:>6.0f} {result['peak_rss_mb']:>8.0f}")
+            for error in errors[:3]:
+                print(f"    错误: {error!r}")
+    finally:
+        stop_server(server)
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    main()